@@ -1,12 +1,41 @@
 from flask import Flask, render_template_string, request, jsonify, send_file
 import requests
 import json
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta, datetime, timezone
 import io
+import os
+import re
+import hashlib
+import hmac
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from docx import Document
 
 app = Flask(__name__)
 
+# Extraction checkpoints live here so failed runs can resume. Point it at
+# persistent storage: the /tmp default doesn't survive between invocations on
+# serverless hosts such as Vercel, so resume and partial downloads won't work
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR') or os.path.join(tempfile.gettempdir(), 'notion_checkpoints')
+CHECKPOINT_TTL = timedelta(hours=6)  # older checkpoints are stale and ignored
+
+# Scheduled extractions: config, per-schedule snapshots and delta exports
+SCHEDULES_FILE = os.environ.get('SCHEDULES_FILE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schedules.json')
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or os.path.join(tempfile.gettempdir(), 'notion_snapshots')
+EXPORT_DIR = os.environ.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'notion_exports')
+
+# Adaptive concurrency for Notion calls, per integration token
+INITIAL_CONCURRENCY = 3   # Notion's documented average rate limit is ~3 req/s
+MAX_CONCURRENCY = 16
+LATENCY_TOLERANCE = 3.0   # back off when latency exceeds this multiple of the best seen
+LATENCY_FLOOR = 0.25      # seconds; faster baselines (e.g. empty queries) are treated as this
+LATENCY_WINDOW = 60       # seconds of history the latency baseline is taken from
+MAX_LIMITERS = 100        # tokens tracked at once, least recently used are dropped
+MAX_RETRIES = 5
+
 # Note: For larger apps, it is recommended to move this to a separate templates/index.html file
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -321,6 +350,11 @@ HTML_TEMPLATE = '''
                 <input type="number" id="lastNDays" value="7" min="1" max="365">
             </div>
 
+            <div class="form-group">
+                <label><input type="checkbox" id="startFresh"> Start fresh</label>
+                <div class="help-text">Ignore progress saved by an earlier failed run of this extraction</div>
+            </div>
+
             <button type="submit" class="button" id="extractBtn">Extract Data</button>
         </form>
 
@@ -369,6 +403,33 @@ HTML_TEMPLATE = '''
             document.getElementById('extractBtn').disabled = show;
         }
 
+        function showResults(items) {
+            extractedData = items;
+
+            const resultText = items.map((item, i) => 
+                `${i + 1}. ${item.title}\\n   Date: ${item.date}\\n   Assignee: ${item.assignee}\\n   Content length: ${item.content.length} chars`
+            ).join('\\n\\n');
+
+            document.getElementById('resultsContent').textContent = resultText;
+            document.getElementById('results').classList.add('show');
+            document.getElementById('downloadButtons').classList.add('show');
+        }
+
+        async function showPartialResults(jobId) {
+            try {
+                const response = await fetch('/extract/partial/' + jobId);
+                if (!response.ok) return false;
+
+                const data = await response.json();
+                if (!data.data.length) return false;
+
+                showResults(data.data);
+                return true;
+            } catch (error) {
+                return false;
+            }
+        }
+
         document.getElementById('extractForm').addEventListener('submit', async function(e) {
             e.preventDefault();
             
@@ -381,7 +442,8 @@ HTML_TEMPLATE = '''
                 specific_date: document.getElementById('specificDate').value,
                 start_date: document.getElementById('startDate').value,
                 end_date: document.getElementById('endDate').value,
-                last_n_days: document.getElementById('lastNDays').value
+                last_n_days: document.getElementById('lastNDays').value,
+                fresh: document.getElementById('startFresh').checked
             };
 
             showLoading(true);
@@ -398,20 +460,20 @@ HTML_TEMPLATE = '''
                 const data = await response.json();
 
                 if (!response.ok) {
+                    // A checkpointed run can still offer what it finished
+                    if (data.job_id && await showPartialResults(data.job_id)) {
+                        showStatus(`Error: ${data.error || 'Extraction failed'}. ${data.completed} page(s) were saved - download them below, or extract again to resume.`, 'error');
+                        return;
+                    }
                     throw new Error(data.error || 'Extraction failed');
                 }
 
-                extractedData = data.data;
+                showResults(data.data);
 
-                const resultText = data.data.map((item, i) => 
-                    `${i + 1}. ${item.title}\\n   Date: ${item.date}\\n   Assignee: ${item.assignee}\\n   Content length: ${item.content.length} chars`
-                ).join('\\n\\n');
-
-                document.getElementById('resultsContent').textContent = resultText;
-                document.getElementById('results').classList.add('show');
-                document.getElementById('downloadButtons').classList.add('show');
-
-                showStatus(`Successfully extracted ${data.data.length} page(s).`, 'success');
+                const resumedText = data.resumed
+                    ? ` (${data.resumed} resumed from a run started ${new Date(data.resumed_from).toLocaleString()} - tick "Start fresh" to re-fetch them)`
+                    : '';
+                showStatus(`Successfully extracted ${data.data.length} page(s)${resumedText}.`, 'success');
 
             } catch (error) {
                 showStatus(`Error: ${error.message}`, 'error');
@@ -499,6 +561,344 @@ def get_date_filter(mode, date_property, **kwargs):
         }
     return None
 
+class NotionAPIError(Exception):
+    """Raised when a Notion API call fails"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def raise_for_notion_error(response):
+    """Raise NotionAPIError with Notion's message if the response failed"""
+    if response.ok:
+        return
+    # Attempt to use Notion's message if available
+    try:
+        message = response.json().get('message', 'API request failed')
+    except Exception:
+        message = 'API request failed'
+    raise NotionAPIError(message, response.status_code)
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight Notion requests for one integration token.
+
+    The limit grows by roughly one slot per round of successful requests and
+    is cut multiplicatively on 429s, server errors, or when latency climbs
+    well above the best seen in the last LATENCY_WINDOW seconds. A 429 also
+    pauses every caller until its Retry-After has passed.
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.latency = None       # moving average, seconds
+        self.latency_samples = deque()  # (time, latency), latencies increasing
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a request slot is free and no Retry-After pause is active"""
+        with self.cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+                elif self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                else:
+                    self.cond.wait()
+
+    def release(self, latency, status_code, retry_after=None):
+        """Free a slot and adjust the limit from the outcome of the request.
+
+        status_code is None when the request raised (timeout, connection error).
+        """
+        with self.cond:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self.requests += 1
+
+            if status_code == 429:
+                self.throttled += 1
+                self.paused_until = max(self.paused_until, now + (retry_after or 1.0))
+                self._decrease(now, 0.5)
+            elif status_code is None or status_code >= 500:
+                self.errors += 1
+                self._decrease(now, 0.75)
+            else:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self.latency > LATENCY_TOLERANCE * max(self._baseline(now, latency), LATENCY_FLOOR):
+                    self._decrease(now, 0.9)
+                elif self.in_flight + 1 >= int(self.limit):
+                    # Only grow when the current limit is actually being used
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self.cond.notify_all()
+
+    def _baseline(self, now, latency):
+        # Minimum latency over a sliding time window: a lasting shift in
+        # Notion's latency becomes the new baseline only after the window
+        # has passed, however many requests are made meanwhile
+        samples = self.latency_samples
+        while samples and samples[-1][1] >= latency:
+            samples.pop()
+        samples.append((now, latency))
+        while samples[0][0] < now - LATENCY_WINDOW:
+            samples.popleft()
+        return samples[0][1]
+
+    def _decrease(self, now, factor):
+        # Requests already in flight report the same congestion, so cut at
+        # most once per round trip rather than once per failed request
+        if now - self.last_decrease < (self.latency or 1.0):
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit * factor)
+        app.logger.info('Notion concurrency limit lowered to %d', int(self.limit))
+
+    def snapshot(self):
+        with self.cond:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'latency_ms': round(self.latency * 1000) if self.latency is not None else None
+            }
+
+
+_limiters = OrderedDict()  # least recently used first
+_limiters_lock = threading.Lock()
+
+
+def token_key(token):
+    """Short, non-reversible name for a token, safe to expose in stats"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:12]
+
+
+def get_limiter(token):
+    """Limiter shared by every extraction using the same token"""
+    with _limiters_lock:
+        key = token_key(token)
+        if key in _limiters:
+            _limiters.move_to_end(key)
+        else:
+            _limiters[key] = AdaptiveLimiter()
+            # Forget the least recently used tokens; anything still using an
+            # evicted limiter keeps its own reference until it finishes
+            while len(_limiters) > MAX_LIMITERS:
+                _limiters.popitem(last=False)
+        return _limiters[key]
+
+
+def notion_request(method, url, limiter, **kwargs):
+    """Call the Notion API through the token's limiter, retrying 429s and 5xx"""
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = requests.request(method, url, timeout=30, **kwargs)
+        except requests.RequestException:
+            limiter.release(time.monotonic() - start, None)
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+            continue
+
+        try:
+            retry_after = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            retry_after = None
+        limiter.release(time.monotonic() - start, response.status_code, retry_after)
+
+        if attempt == MAX_RETRIES:
+            return response
+        if response.status_code == 429:
+            continue  # acquire() waits out Retry-After
+        if response.status_code >= 500:
+            time.sleep(0.5 * 2 ** attempt)
+            continue
+        return response
+
+
+def get_job_id(token, database_id, payload, date_property, person_property):
+    """Stable ID for an extraction so a retried run finds its checkpoint"""
+    key = json.dumps([token, database_id, payload, date_property, person_property], sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def checkpoint_path(job_id):
+    return os.path.join(CHECKPOINT_DIR, f'{job_id}.json')
+
+
+def pages_log_path(job_id):
+    return os.path.join(CHECKPOINT_DIR, f'{job_id}.pages.jsonl')
+
+
+# A checkpoint is two files: a small JSON file with the query cursor, the
+# page IDs in query order and timestamps, rewritten once per batch, and a
+# JSONL log that each finished page is appended to. Page content is written
+# once, however large the extraction gets.
+
+def new_checkpoint():
+    return {"cursor": None, "order": [], "completed": {}, "created_at": datetime.now().isoformat()}
+
+
+def load_checkpoint(job_id):
+    """Load a saved checkpoint, or None if there isn't a usable one"""
+    try:
+        with open(checkpoint_path(job_id), encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        created_at = datetime.fromisoformat(checkpoint['created_at'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    # Pages change, so content saved long ago must not be passed off as current
+    if datetime.now() - created_at > CHECKPOINT_TTL:
+        delete_checkpoint(job_id)
+        return None
+
+    checkpoint['completed'] = {}
+    try:
+        with open(pages_log_path(job_id), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                checkpoint['completed'][item['page_id']] = item
+    except OSError:
+        pass
+    return checkpoint
+
+
+def save_checkpoint(job_id, checkpoint):
+    """Write the cursor and page order atomically so a crash never leaves half a file"""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = checkpoint_path(job_id)
+    checkpoint['updated_at'] = datetime.now().isoformat()
+    state = {key: value for key, value in checkpoint.items() if key != 'completed'}
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def append_checkpoint_page(job_id, item):
+    """Record one finished page in the checkpoint's page log"""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    with open(pages_log_path(job_id), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+def delete_checkpoint(job_id):
+    for path in (checkpoint_path(job_id), pages_log_path(job_id)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def checkpoint_pages(checkpoint):
+    """Finished pages in query order, whichever run fetched them"""
+    completed = checkpoint['completed']
+    ordered = [completed[page_id] for page_id in checkpoint['order'] if page_id in completed]
+    # Pages logged before a crash could save their batch's order go last
+    listed = set(checkpoint['order'])
+    return ordered + [item for page_id, item in completed.items() if page_id not in listed]
+
+
+def query_database(database_id, payload, headers, limiter, start_cursor=None):
+    """Fetch one batch (up to 100 pages) of database query results"""
+    query = dict(payload, page_size=100)
+    if start_cursor:
+        query['start_cursor'] = start_cursor
+
+    response = notion_request(
+        'POST',
+        f'https://api.notion.com/v1/databases/{database_id}/query',
+        limiter,
+        headers=headers,
+        json=query
+    )
+    raise_for_notion_error(response)
+    return response.json()
+
+
+def process_page(page, headers, limiter, date_property, person_property):
+    """Extract title, date, assignee and block text from a database page"""
+    props = page.get('properties', {})
+
+    # Get title
+    title = 'Untitled'
+    for prop_name in ['Name', 'Title', 'name', 'title']:
+        if prop_name in props and props[prop_name].get('title'):
+            title_field = props[prop_name]['title']
+            if isinstance(title_field, list) and title_field:
+                title = title_field[0].get('plain_text', title)
+            break
+
+    # Get date
+    page_date = 'No date'
+    if date_property in props and props[date_property].get('date'):
+        page_date = props[date_property]['date'].get('start', 'No date')
+
+    # Get assignee
+    assignee = 'Unassigned'
+    if person_property in props and props[person_property].get('people'):
+        people = props[person_property]['people']
+        if isinstance(people, list) and people:
+            assignee = people[0].get('name') or people[0].get('id') or 'Unknown'
+
+    # Fetch blocks
+    blocks_response = notion_request(
+        'GET',
+        f'https://api.notion.com/v1/blocks/{page.get("id")}/children',
+        limiter,
+        headers=headers
+    )
+
+    # Rate limits and server errors are transient: fail so the page isn't
+    # checkpointed as done and gets fetched again on resume
+    if blocks_response.status_code == 429 or blocks_response.status_code >= 500:
+        raise_for_notion_error(blocks_response)
+
+    content = ''
+    if blocks_response.ok:
+        blocks = blocks_response.json().get('results', [])
+        text_parts = []
+
+        for block in blocks:
+            block_type = block.get('type')
+            if block_type and block.get(block_type, {}).get('rich_text'):
+                texts = [t.get('plain_text', '') for t in block[block_type]['rich_text']]
+                text_parts.append(' '.join(texts))
+            else:
+                # handle paragraph which may be stored under 'paragraph' with 'rich_text'
+                if block.get('paragraph') and block['paragraph'].get('rich_text'):
+                    texts = [t.get('plain_text', '') for t in block['paragraph']['rich_text']]
+                    text_parts.append(' '.join(texts))
+
+        content = '\n'.join([p for p in text_parts if p])
+
+    return {
+        'page_id': page.get('id'),
+        'title': title,
+        'date': page_date,
+        'assignee': assignee,
+        'content': content,
+        'url': f"https://www.notion.so/{page.get('id', '').replace('-', '')}"
+    }
+
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
@@ -534,93 +934,217 @@ def extract():
         )
         
         payload = {"filter": date_filter} if date_filter else {}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    # Resume from the last checkpoint of an identical extraction, if any
+    job_id = get_job_id(token, database_id, payload, date_property, person_property)
+    limiter = get_limiter(token)
+    checkpoint = None if data.get('fresh') else load_checkpoint(job_id)
+    if checkpoint is None:
+        # Clear anything unusable, such as a page log without its cursor file
+        delete_checkpoint(job_id)
+        checkpoint = new_checkpoint()
+    completed = checkpoint['completed']
+    ordered = set(checkpoint['order'])
+    resumed = len(completed)
+
+    try:
+        while True:
+            # Query database, one batch of up to 100 pages at a time
+            result = query_database(database_id, payload, headers, limiter, checkpoint['cursor'])
+
+            for page in result.get('results', []):
+                if page.get('id') not in ordered:
+                    checkpoint['order'].append(page.get('id'))
+                    ordered.add(page.get('id'))
+
+            # Process pages in parallel, skipping any finished by an earlier
+            # run; the limiter decides how many block fetches are in flight
+            pending = [page for page in result.get('results', []) if page.get('id') not in completed]
+            error = None
+
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+                futures = [
+                    (page.get('id'), executor.submit(process_page, page, headers, limiter, date_property, person_property))
+                    for page in pending
+                ]
+
+                for page_id, future in futures:
+                    if future.cancelled():
+                        continue
+                    try:
+                        item = future.result()
+                    except Exception as e:
+                        # Keep what already finished, don't start anything new
+                        if error is None:
+                            error = e
+                            for _, other in futures:
+                                other.cancel()
+                        continue
+
+                    completed[page_id] = item
+                    append_checkpoint_page(job_id, item)
+
+            if error is not None:
+                raise error
+
+            if not result.get('has_more') or not result.get('next_cursor'):
+                break
+
+            # Batch done: later resumes start from the next cursor
+            checkpoint['cursor'] = result['next_cursor']
+            save_checkpoint(job_id, checkpoint)
+
+    except Exception as e:
+        status_code = e.status_code if isinstance(e, NotionAPIError) else 500
+
+        # A 4xx other than a rate limit (e.g. an expired cursor) would fail
+        # the same way on every resume, so start over next time instead
+        if not completed or (400 <= status_code < 500 and status_code != 429):
+            delete_checkpoint(job_id)
+            return jsonify({"error": str(e)}), status_code
+
+        try:
+            save_checkpoint(job_id, checkpoint)
+        except OSError:
+            # Without a usable checkpoint there is nothing to resume from
+            app.logger.exception('Could not save checkpoint %s', job_id)
+            return jsonify({"error": str(e)}), status_code
+
+        return jsonify({
+            "error": str(e),
+            "job_id": job_id,
+            "completed": len(completed),
+            "concurrency": limiter.snapshot()
+        }), status_code
+
+    delete_checkpoint(job_id)
+
+    if not completed:
+        return jsonify({"error": "No pages found matching criteria"}), 404
+
+    return jsonify({
+        "data": checkpoint_pages(checkpoint),
+        "job_id": job_id,
+        "resumed": resumed,
+        "resumed_from": checkpoint['created_at'] if resumed else None,
+        "concurrency": limiter.snapshot()
+    })
+
+@app.route('/stats/concurrency')
+def concurrency_stats():
+    """Current adaptive limit and counters for each token seen by this instance"""
+    error = check_cron_secret()
+    if error:
+        return error
+
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return jsonify({key: limiter.snapshot() for key, limiter in limiters.items()})
+
+@app.route('/extract/partial/<job_id>', methods=['GET', 'DELETE'])
+def extract_partial(job_id):
+    """Download what a failed extraction finished, or discard its checkpoint"""
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return jsonify({"error": "Invalid job_id"}), 400
+
+    checkpoint = load_checkpoint(job_id)
+    if checkpoint is None:
+        return jsonify({"error": "No checkpoint found for this job"}), 404
+
+    if request.method == 'DELETE':
+        delete_checkpoint(job_id)
+        return jsonify({"deleted": job_id})
+
+    return jsonify({
+        "data": checkpoint_pages(checkpoint),
+        "job_id": job_id,
+        "completed": len(checkpoint['completed']),
+        "created_at": checkpoint['created_at'],
+        "updated_at": checkpoint.get('updated_at')
+    })
+
+EXPORT_MIMETYPES = {
+    'json': 'application/json',
+    'txt': 'text/plain',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+}
+
+def build_export(format, data):
+    """Render extracted pages as a json, txt or docx file in memory"""
+    # JSON export
+    if format == 'json':
+        output = io.BytesIO()
+        output.write(json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+        output.seek(0)
+        return output
+
+    # TXT export
+    elif format == 'txt':
+        text = f"NOTION EXPORT - {date.today().isoformat()}\n"
+        text += "=" * 80 + "\n\n"
         
-        # Query database
-        response = requests.post(
-            f'https://api.notion.com/v1/databases/{database_id}/query',
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        
-        if not response.ok:
-            # Attempt to return Notion's message if available
-            try:
-                err = response.json()
-                return jsonify({"error": err.get('message', 'API request failed')}), response.status_code
-            except Exception:
-                return jsonify({"error": "API request failed"}), response.status_code
-        
-        pages = response.json().get('results', [])
-        
-        if not pages:
-            return jsonify({"error": "No pages found matching criteria"}), 404
-        
-        # Process pages
-        processed_data = []
+        for item in data:
+            text += "\n" + "=" * 80 + "\n"
+            text += f"TITLE: {item.get('title', 'Untitled')}\n"
+            if item.get('change'):
+                text += f"CHANGE: {describe_change(item)}\n"
+            # Removed pages only have their title and URL left
+            if item.get('change') != 'removed':
+                text += f"DATE: {item.get('date', 'No date')}\n"
+                text += f"BY: {item.get('assignee', 'Unassigned')}\n"
+            text += f"URL: {item.get('url', '')}\n"
+            text += "=" * 80 + "\n\n"
+            text += item.get('content', '') + "\n\n"
         
-        for page in pages:
-            props = page.get('properties', {})
-            
-            # Get title
-            title = 'Untitled'
-            for prop_name in ['Name', 'Title', 'name', 'title']:
-                if prop_name in props and props[prop_name].get('title'):
-                    title_field = props[prop_name]['title']
-                    if isinstance(title_field, list) and title_field:
-                        title = title_field[0].get('plain_text', title)
-                    break
-            
-            # Get date
-            page_date = 'No date'
-            if date_property in props and props[date_property].get('date'):
-                page_date = props[date_property]['date'].get('start', 'No date')
-            
-            # Get assignee
-            assignee = 'Unassigned'
-            if person_property in props and props[person_property].get('people'):
-                people = props[person_property]['people']
-                if isinstance(people, list) and people:
-                    assignee = people[0].get('name') or people[0].get('id') or 'Unknown'
-            
-            # Fetch blocks
-            blocks_response = requests.get(
-                f'https://api.notion.com/v1/blocks/{page.get("id")}/children',
-                headers=headers,
-                timeout=30
-            )
-            
-            content = ''
-            if blocks_response.ok:
-                blocks = blocks_response.json().get('results', [])
-                text_parts = []
-                
-                for block in blocks:
-                    block_type = block.get('type')
-                    if block_type and block.get(block_type, {}).get('rich_text'):
-                        texts = [t.get('plain_text', '') for t in block[block_type]['rich_text']]
-                        text_parts.append(' '.join(texts))
+        output = io.BytesIO()
+        output.write(text.encode('utf-8'))
+        output.seek(0)
+        return output
+
+    # DOCX export
+    elif format == 'docx':
+        doc = Document()
+        doc.add_heading('Notion Export', level=1)
+        doc.add_paragraph(f"Export date: {date.today().isoformat()}")
+        doc.add_paragraph('')
+
+        for i, item in enumerate(data, start=1):
+            title = item.get('title', 'Untitled')
+            page_date = item.get('date', 'No date')
+            assignee = item.get('assignee', 'Unassigned')
+            content = item.get('content', '')
+
+            # Title and metadata
+            doc.add_heading(f"{i}. {title}", level=2)
+            if item.get('change'):
+                doc.add_paragraph(f"Change: {describe_change(item)}")
+            if item.get('change') != 'removed':
+                doc.add_paragraph(f"Date: {page_date}")
+                doc.add_paragraph(f"Assignee: {assignee}")
+            doc.add_paragraph(f"URL: {item.get('url', '')}")
+            doc.add_paragraph('')
+
+            # Content — preserve paragraphs split by newline
+            if content:
+                for para in content.splitlines():
+                    # skip empty lines to avoid many empty paragraphs
+                    if para.strip():
+                        doc.add_paragraph(para)
                     else:
-                        # handle paragraph which may be stored under 'paragraph' with 'rich_text'
-                        if block.get('paragraph') and block['paragraph'].get('rich_text'):
-                            texts = [t.get('plain_text', '') for t in block['paragraph']['rich_text']]
-                            text_parts.append(' '.join(texts))
-                
-                content = '\n'.join([p for p in text_parts if p])
-            
-            processed_data.append({
-                'page_id': page.get('id'),
-                'title': title,
-                'date': page_date,
-                'assignee': assignee,
-                'content': content,
-                'url': f"https://www.notion.so/{page.get('id', '').replace('-', '')}"
-            })
-        
-        return jsonify({"data": processed_data})
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+                        doc.add_paragraph('')
+
+            # Add page break between entries (but not after last)
+            if i != len(data):
+                doc.add_page_break()
+
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        buffer.seek(0)
+        return buffer
+
+    return None
 
 @app.route('/download/<format>', methods=['POST'])
 def download(format):
@@ -631,91 +1155,413 @@ def download(format):
         if not data:
             return jsonify({"error": "No data provided"}), 400
 
-        # JSON export
-        if format == 'json':
-            output = io.BytesIO()
-            output.write(json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
-            output.seek(0)
-            return send_file(
-                output,
-                mimetype='application/json',
-                as_attachment=True,
-                download_name=f'notion_export_{date.today().isoformat()}.json'
-            )
-
-        # TXT export
-        elif format == 'txt':
-            text = f"NOTION EXPORT - {date.today().isoformat()}\n"
-            text += "=" * 80 + "\n\n"
-            
-            for item in data:
-                text += "\n" + "=" * 80 + "\n"
-                text += f"TITLE: {item.get('title', 'Untitled')}\n"
-                text += f"DATE: {item.get('date', 'No date')}\n"
-                text += f"BY: {item.get('assignee', 'Unassigned')}\n"
-                text += f"URL: {item.get('url', '')}\n"
-                text += "=" * 80 + "\n\n"
-                text += item.get('content', '') + "\n\n"
-            
-            output = io.BytesIO()
-            output.write(text.encode('utf-8'))
-            output.seek(0)
-            return send_file(
-                output,
-                mimetype='text/plain',
-                as_attachment=True,
-                download_name=f'notion_export_{date.today().isoformat()}.txt'
-            )
-
-        # DOCX export
-        elif format == 'docx':
-            doc = Document()
-            doc.add_heading('Notion Export', level=1)
-            doc.add_paragraph(f"Export date: {date.today().isoformat()}")
-            doc.add_paragraph('')
+        output = build_export(format, data)
+        if output is None:
+            return jsonify({"error": f"Unsupported format: {format}"}), 400
 
-            for i, item in enumerate(data, start=1):
-                title = item.get('title', 'Untitled')
-                page_date = item.get('date', 'No date')
-                assignee = item.get('assignee', 'Unassigned')
-                content = item.get('content', '')
+        return send_file(
+            output,
+            mimetype=EXPORT_MIMETYPES[format],
+            as_attachment=True,
+            download_name=f'notion_export_{date.today().isoformat()}.{format}'
+        )
 
-                # Title and metadata
-                doc.add_heading(f"{i}. {title}", level=2)
-                doc.add_paragraph(f"Date: {page_date}")
-                doc.add_paragraph(f"Assignee: {assignee}")
-                doc.add_paragraph(f"URL: {item.get('url', '')}")
-                doc.add_paragraph('')
-
-                # Content — preserve paragraphs split by newline
-                if content:
-                    for para in content.splitlines():
-                        # skip empty lines to avoid many empty paragraphs
-                        if para.strip():
-                            doc.add_paragraph(para)
-                        else:
-                            doc.add_paragraph('')
-
-                # Add page break between entries (but not after last)
-                if i != len(data):
-                    doc.add_page_break()
-
-            buffer = io.BytesIO()
-            doc.save(buffer)
-            buffer.seek(0)
-
-            return send_file(
-                buffer,
-                mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                as_attachment=True,
-                download_name=f'notion_export_{date.today().isoformat()}.docx'
-            )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+# Scheduled snapshot exports
+#
+# Schedules are read from SCHEDULES_FILE, a JSON list such as:
+#
+#   [{"name": "daily-tasks", "database_id": "...", "token_env": "NOTION_TOKEN",
+#     "extract_mode": "last_n_days", "last_n_days": 7, "formats": ["json", "txt"],
+#     "interval_minutes": 1440}]
+#
+# Each run compares the database against the schedule's last snapshot and
+# exports only pages that were added, removed or modified. Pages last edited
+# well before the previous run are not re-fetched at all.
+#
+# SNAPSHOT_DIR and EXPORT_DIR must be on persistent storage. Their /tmp
+# defaults don't survive between invocations on serverless hosts such as
+# Vercel, where every run would start a new baseline and export everything.
+#
+# The /schedules endpoints are disabled unless CRON_SECRET is set, and then
+# require it as a bearer token.
+
+def load_schedules():
+    """Read and validate SCHEDULES_FILE; raises ValueError if it is malformed"""
+    try:
+        with open(SCHEDULES_FILE, encoding='utf-8') as f:
+            schedules = json.load(f)
+    except OSError:
+        return []
+    except ValueError as e:
+        raise ValueError(f"{SCHEDULES_FILE} is not valid JSON: {e}")
+
+    if not isinstance(schedules, list) or not all(isinstance(s, dict) for s in schedules):
+        raise ValueError(f"{SCHEDULES_FILE} must contain a list of schedule objects")
+
+    names = set()
+    for schedule in schedules:
+        name = schedule.get('name')
+        if not isinstance(name, str) or not re.fullmatch(r'[\w-]+', name):
+            raise ValueError(f"Invalid schedule name: {name!r}")
+        if name in names:
+            raise ValueError(f"Duplicate schedule name: {name!r}")
+        names.add(name)
+
+        # Tokens come from the environment, never from this file
+        token_env = schedule.get('token_env')
+        if 'token' in schedule or not isinstance(token_env, str) or not token_env:
+            raise ValueError(f"Schedule {name!r} needs token_env, the environment variable holding its token")
+
+        # Caught here rather than after a run has already spent its API calls
+        formats = schedule.get('formats', ['json'])
+        if (not isinstance(formats, list) or not formats
+                or not all(isinstance(f, str) and f in EXPORT_MIMETYPES for f in formats)):
+            raise ValueError(f"Schedule {name!r}: formats must be a list drawn from {', '.join(EXPORT_MIMETYPES)}")
+
+        interval = schedule.get('interval_minutes', 1440)
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+            raise ValueError(f"Schedule {name!r}: interval_minutes must be a positive number")
+    return schedules
+
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f'{name}.json')
+
+
+def load_snapshot(name):
+    try:
+        with open(snapshot_path(name), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(name, snapshot):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(name)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def content_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def parse_time(value):
+    """Parse an ISO timestamp (Notion's trailing Z included) as UTC-aware"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def schedule_config_hash(schedule):
+    """Hash of the settings that decide which pages a schedule extracts"""
+    return content_hash({
+        'database_id': schedule.get('database_id'),
+        'token_env': schedule.get('token_env'),
+        'extract_mode': schedule.get('extract_mode') or 'all',
+        'date_property': schedule.get('date_property') or 'Date',
+        'person_property': schedule.get('person_property') or 'Assignee',
+        'specific_date': schedule.get('specific_date'),
+        'start_date': schedule.get('start_date'),
+        'end_date': schedule.get('end_date'),
+        'last_n_days': schedule.get('last_n_days')
+    })
+
+
+def load_baseline(schedule):
+    """The schedule's last snapshot, or None if there is none or it was taken
+    with different settings (a different database or filter can't be diffed)"""
+    snapshot = load_snapshot(schedule['name'])
+    if not snapshot or snapshot.get('config') != schedule_config_hash(schedule):
+        return None
+    return snapshot
+
+
+def describe_change(item):
+    if item.get('changed'):
+        return f"{item['change']} ({', '.join(item['changed'])})"
+    return item['change']
+
+
+def run_schedule(schedule):
+    """Run one scheduled extraction, export its delta and store the new snapshot"""
+    name = schedule['name']
+    token = os.environ.get(schedule['token_env'])
+    database_id = schedule.get('database_id')
+    date_property = schedule.get('date_property') or 'Date'
+    person_property = schedule.get('person_property') or 'Assignee'
+
+    if not token:
+        raise ValueError(f"Schedule {name!r}: environment variable {schedule['token_env']} is not set")
+    if not database_id:
+        raise ValueError(f"Schedule {name!r} needs a database_id")
+
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json',
+        'Notion-Version': '2022-06-28'
+    }
+    limiter = get_limiter(token)
+
+    date_filter = get_date_filter(
+        schedule.get('extract_mode') or 'all',
+        date_property,
+        specific_date=schedule.get('specific_date'),
+        start_date=schedule.get('start_date'),
+        end_date=schedule.get('end_date'),
+        last_n_days=schedule.get('last_n_days')
+    )
+    payload = {"filter": date_filter} if date_filter else {}
+
+    # Database queries are cheap (100 pages per call); block fetches aren't
+    started = datetime.now(timezone.utc)
+    pages = []
+    cursor = None
+    while True:
+        result = query_database(database_id, payload, headers, limiter, cursor)
+        pages.extend(result.get('results', []))
+        if not result.get('has_more') or not result.get('next_cursor'):
+            break
+        cursor = result['next_cursor']
+
+    baseline = load_baseline(schedule)
+    previous = baseline['pages'] if baseline else {}
+    current = {}
+    changed_pages = []
+
+    # last_edited_time is rounded to the minute, so an edit in the same minute
+    # as the previous run's query looks unchanged; re-fetch anything edited
+    # that close to it and let the content hashes weed out false positives
+    recheck_after = parse_time(baseline['last_run']) - timedelta(minutes=1) if baseline else None
+
+    for page in pages:
+        page_id = page.get('id')
+        entry = previous.get(page_id)
+        edited = page.get('last_edited_time')
+        properties = content_hash(page.get('properties', {}))
+
+        if entry and edited and entry['edited'] == edited and parse_time(edited) < recheck_after:
+            current[page_id] = entry
         else:
-            return jsonify({"error": f"Unsupported format: {format}"}), 400
+            current[page_id] = {'edited': edited, 'properties': properties}
+            changed_pages.append(page)
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        items = list(executor.map(
+            lambda page: process_page(page, headers, limiter, date_property, person_property),
+            changed_pages
+        ))
+
+    delta = []
+    for item in items:
+        page_id = item['page_id']
+        entry = current[page_id]
+        entry['title'] = item['title']
+        entry['content'] = content_hash(item['content'])
+
+        old = previous.get(page_id)
+        if old is None:
+            delta.append(dict(item, change='added'))
+            continue
+
+        # Editing a page can leave what we export untouched (e.g. a comment)
+        changed = [field for field in ('properties', 'content') if old.get(field) != entry[field]]
+        if changed:
+            delta.append(dict(item, change='modified', changed=changed))
+
+    for page_id, old in previous.items():
+        if page_id not in current:
+            delta.append({
+                'page_id': page_id,
+                'title': old.get('title', 'Untitled'),
+                'change': 'removed',
+                'url': f"https://www.notion.so/{page_id.replace('-', '')}"
+            })
+
+    # Export first, so a failed write leaves the old snapshot to diff against
+    files = []
+    if delta:
+        export_dir = os.path.join(EXPORT_DIR, name)
+        os.makedirs(export_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        for format in schedule.get('formats') or ['json']:
+            output = build_export(format, delta)
+            if output is None:
+                raise ValueError(f"Unsupported format: {format}")
+            path = os.path.join(export_dir, f'{name}_{stamp}.{format}')
+            with open(path, 'wb') as f:
+                f.write(output.getvalue())
+            files.append(os.path.basename(path))
+
+    save_snapshot(name, {
+        'last_run': started.isoformat(),
+        'config': schedule_config_hash(schedule),
+        'pages': current
+    })
+
+    return {
+        'name': name,
+        'baseline': baseline is None,
+        'pages': len(current),
+        'fetched': len(changed_pages),
+        'added': sum(1 for item in delta if item['change'] == 'added'),
+        'modified': sum(1 for item in delta if item['change'] == 'modified'),
+        'removed': sum(1 for item in delta if item['change'] == 'removed'),
+        'files': files
+    }
+
+
+def schedule_is_due(schedule, now):
+    baseline = load_baseline(schedule)
+    if not baseline:
+        return True
+    interval = timedelta(minutes=float(schedule.get('interval_minutes') or 1440))
+    return parse_time(baseline['last_run']) + interval <= now
+
+
+_schedules_lock = threading.Lock()
+
+
+def run_due_schedules(only=None):
+    """Run every due schedule (or just the named one, due or not)"""
+    # Skip rather than queue if the background thread and a request overlap
+    if not _schedules_lock.acquire(blocking=False):
+        return None
+
+    try:
+        results = []
+        now = datetime.now(timezone.utc)
+        for schedule in load_schedules():
+            if only is not None and schedule['name'] != only:
+                continue
+            if only is None and not schedule_is_due(schedule, now):
+                continue
+            try:
+                results.append(run_schedule(schedule))
+            except Exception as e:
+                app.logger.exception('Scheduled extraction %s failed', schedule['name'])
+                results.append({'name': schedule['name'], 'error': str(e)})
+        return results
+    finally:
+        _schedules_lock.release()
+
+
+def start_scheduler(poll_seconds=60):
+    """Run due schedules from a background thread (long-running servers only)"""
+    def loop():
+        while True:
+            try:
+                run_due_schedules()
+            except Exception:
+                app.logger.exception('Scheduler run failed')
+            time.sleep(poll_seconds)
+
+    threading.Thread(target=loop, name='notion-scheduler', daemon=True).start()
+
+def check_cron_secret():
+    """Error response unless the caller sent CRON_SECRET as a bearer token"""
+    secret = os.environ.get('CRON_SECRET')
+    if not secret:
+        return jsonify({"error": "Set CRON_SECRET to enable the schedule endpoints"}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {secret}'):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+@app.route('/schedules')
+def schedules():
+    """Configured schedules with the time and size of their last snapshot"""
+    error = check_cron_secret()
+    if error:
+        return error
 
+    try:
+        configured = load_schedules()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 500
+
+    result = []
+    for schedule in configured:
+        snapshot = load_snapshot(schedule['name']) or {}
+        result.append({
+            'name': schedule['name'],
+            'extract_mode': schedule.get('extract_mode') or 'all',
+            'formats': schedule.get('formats') or ['json'],
+            'interval_minutes': schedule.get('interval_minutes') or 1440,
+            'last_run': snapshot.get('last_run'),
+            'pages': len(snapshot.get('pages', {}))
+        })
+    return jsonify({"schedules": result})
+
+@app.route('/schedules/run', methods=['GET', 'POST'])
+def schedules_run():
+    """Trigger due schedules (or ?name= to force one) from an external cron job"""
+    error = check_cron_secret()
+    if error:
+        return error
+
+    try:
+        results = run_due_schedules(only=request.args.get('name'))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    if results is None:
+        return jsonify({"error": "Scheduled extractions are already running"}), 409
+    return jsonify({"results": results})
+
+@app.route('/schedules/<name>/exports')
+def schedule_exports(name):
+    """Delta files written for a schedule, newest first"""
+    error = check_cron_secret()
+    if error:
+        return error
+    if not re.fullmatch(r'[\w-]+', name):
+        return jsonify({"error": "Invalid schedule name"}), 400
+
+    export_dir = os.path.join(EXPORT_DIR, name)
+    try:
+        filenames = os.listdir(export_dir)
+    except OSError:
+        filenames = []
+
+    exports = []
+    for filename in sorted(filenames, reverse=True):
+        if os.path.splitext(filename)[1][1:] not in EXPORT_MIMETYPES:
+            continue
+        stat = os.stat(os.path.join(export_dir, filename))
+        exports.append({
+            'filename': filename,
+            'size': stat.st_size,
+            'created_at': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()
+        })
+    return jsonify({"exports": exports})
+
+@app.route('/schedules/<name>/exports/<filename>')
+def schedule_export_download(name, filename):
+    """Download one delta file written by a scheduled run"""
+    error = check_cron_secret()
+    if error:
+        return error
+    if not re.fullmatch(r'[\w-]+', name) or not re.fullmatch(r'[\w-]+\.(json|txt|docx)', filename):
+        return jsonify({"error": "Invalid export name"}), 400
+
+    path = os.path.join(EXPORT_DIR, name, filename)
+    if not os.path.isfile(path):
+        return jsonify({"error": "Export not found"}), 404
+
+    return send_file(
+        path,
+        mimetype=EXPORT_MIMETYPES[os.path.splitext(filename)[1][1:]],
+        as_attachment=True,
+        download_name=filename
+    )
+
 if __name__ == '__main__':
+    # With the debug reloader only the child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class MockResponse:
+    """Stands in for requests.Response in the mocked Notion APIs"""
+
+    def __init__(self, status_code, body, headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        return self._body
@@ -0,0 +1,168 @@
+"""Checkpointed extractions: resume, partial downloads and discarding stale progress"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as notion_app
+from conftest import MockResponse
+
+BODY = {'token': 'secret_test', 'database_id': 'db'}
+
+
+class MockNotion:
+    """A database of pages whose block fetches can be made to fail"""
+
+    def __init__(self, pages=250):
+        self.pages = [{'id': f'page-{i}', 'properties': {}} for i in range(pages)]
+        self.failing = set()
+        self.bad_cursor = False
+        self.block_fetches = 0
+
+    def request(self, method, url, headers=None, json=None, timeout=None):
+        if method == 'POST':
+            if self.bad_cursor and json.get('start_cursor'):
+                return MockResponse(400, {'message': 'start_cursor is invalid'})
+            start = int(json.get('start_cursor') or 0)
+            end = start + json['page_size']
+            return MockResponse(200, {
+                'results': self.pages[start:end],
+                'has_more': end < len(self.pages),
+                'next_cursor': str(end) if end < len(self.pages) else None
+            })
+
+        self.block_fetches += 1
+        page_id = url.split('/')[-2]
+        if page_id in self.failing:
+            return MockResponse(500, {'message': 'Internal server error'})
+        return MockResponse(200, {'results': [
+            {'type': 'paragraph', 'paragraph': {'rich_text': [{'plain_text': f'Content of {page_id}'}]}}
+        ]})
+
+
+@pytest.fixture
+def mock(tmp_path, monkeypatch):
+    monkeypatch.setattr(notion_app, 'CHECKPOINT_DIR', str(tmp_path))
+    monkeypatch.setattr(notion_app, '_limiters', notion_app.OrderedDict())
+    monkeypatch.setattr(notion_app, 'MAX_RETRIES', 0)
+    mock = MockNotion()
+    monkeypatch.setattr(notion_app.requests, 'request', mock.request)
+    return mock
+
+
+@pytest.fixture
+def client():
+    return notion_app.app.test_client()
+
+
+def fail_then_heal(client, mock, page_id='page-130'):
+    """Run an extraction that fails on page_id, then let that page succeed"""
+    mock.failing.add(page_id)
+    response = client.post('/extract', json=BODY)
+    assert response.status_code == 500
+
+    failed = response.get_json()
+    assert failed['completed'] > 0
+    mock.failing.clear()
+    mock.block_fetches = 0
+    return failed
+
+
+def test_resume_fetches_only_remaining_pages_in_query_order(client, mock):
+    failed = fail_then_heal(client, mock)
+
+    response = client.post('/extract', json=BODY)
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert body['resumed'] == failed['completed']
+    assert mock.block_fetches == 250 - failed['completed']
+    assert [item['page_id'] for item in body['data']] == [page['id'] for page in mock.pages]
+
+    # A finished run leaves nothing behind to resume from
+    assert notion_app.load_checkpoint(body['job_id']) is None
+
+
+def test_partial_download_after_failure(client, mock):
+    failed = fail_then_heal(client, mock)
+
+    response = client.get(f"/extract/partial/{failed['job_id']}")
+    body = response.get_json()
+    page_ids = [item['page_id'] for item in body['data']]
+
+    assert response.status_code == 200
+    assert body['completed'] == failed['completed']
+    assert 'page-130' not in page_ids
+    assert page_ids == sorted(page_ids, key=lambda page_id: int(page_id.split('-')[1]))
+
+    assert client.delete(f"/extract/partial/{failed['job_id']}").status_code == 200
+    assert client.get(f"/extract/partial/{failed['job_id']}").status_code == 404
+
+
+def test_partial_download_rejects_bad_job_id(client, mock):
+    assert client.get('/extract/partial/not-a-job').status_code == 400
+    assert client.get('/extract/partial/' + '0' * 32).status_code == 404
+
+
+def test_expired_checkpoint_is_ignored(client, mock):
+    failed = fail_then_heal(client, mock)
+
+    path = notion_app.checkpoint_path(failed['job_id'])
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    state['created_at'] = (datetime.now() - notion_app.CHECKPOINT_TTL - timedelta(minutes=1)).isoformat()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+    body = client.post('/extract', json=BODY).get_json()
+
+    assert body['resumed'] == 0
+    assert mock.block_fetches == 250
+
+
+def test_fresh_discards_saved_progress(client, mock):
+    fail_then_heal(client, mock)
+
+    body = client.post('/extract', json=dict(BODY, fresh=True)).get_json()
+
+    assert body['resumed'] == 0
+    assert mock.block_fetches == 250
+    assert len(body['data']) == 250
+
+
+def test_rejected_cursor_drops_checkpoint(client, mock):
+    failed = fail_then_heal(client, mock)
+    mock.bad_cursor = True
+
+    response = client.post('/extract', json=BODY)
+
+    assert response.status_code == 400
+    assert 'job_id' not in response.get_json()
+    assert notion_app.load_checkpoint(failed['job_id']) is None
+
+    mock.bad_cursor = False
+    assert client.post('/extract', json=BODY).get_json()['resumed'] == 0
+
+
+def test_truncated_page_log_line_is_refetched(client, mock):
+    failed = fail_then_heal(client, mock)
+    with open(notion_app.pages_log_path(failed['job_id']), 'a', encoding='utf-8') as f:
+        f.write('{"page_id": "page-1')
+
+    body = client.post('/extract', json=BODY).get_json()
+
+    assert body['resumed'] == failed['completed']
+    assert len(body['data']) == 250
+
+
+def test_unwritable_checkpoint_dir_returns_json_error(client, mock, tmp_path, monkeypatch):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+    monkeypatch.setattr(notion_app, 'CHECKPOINT_DIR', str(blocker))
+    mock.failing.add('page-130')
+
+    response = client.post('/extract', json=BODY)
+
+    assert response.status_code == 500
+    assert response.get_json()['error']
+    assert 'job_id' not in response.get_json()
@@ -0,0 +1,192 @@
+"""Adaptive concurrency against a mock Notion API with different throttling profiles"""
+import random
+import threading
+import time
+
+import pytest
+
+import app as notion_app
+from conftest import MockResponse
+
+
+class MockNotion:
+    """Serves database queries and block fetches, throttled like Notion.
+
+    rate caps block fetches per second with a token bucket (429 + Retry-After
+    once it's empty), error_rate returns intermittent 502s.
+    """
+
+    def __init__(self, pages=150, rate=None, retry_after=0.2, error_rate=0.0, latency=0.01):
+        self.pages = [{'id': f'page-{i}', 'properties': {}} for i in range(pages)]
+        self.rate = rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.latency = latency
+        self.tokens = rate or 0
+        self.refilled = time.monotonic()
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+        self.served = 0
+        self.throttled = 0
+        self.failed = 0
+        self.throttled_at = []
+        self.served_at = []
+
+    def request(self, method, url, headers=None, json=None, timeout=None):
+        if method == 'POST':
+            start = int(json.get('start_cursor') or 0)
+            end = start + json['page_size']
+            return MockResponse(200, {
+                'results': self.pages[start:end],
+                'has_more': end < len(self.pages),
+                'next_cursor': str(end) if end < len(self.pages) else None
+            })
+
+        time.sleep(self.latency)
+        with self.lock:
+            now = time.monotonic()
+            if self.rate is not None:
+                self.tokens = min(self.rate, self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens < 1:
+                    self.throttled += 1
+                    self.throttled_at.append(now)
+                    return MockResponse(429, {'message': 'Rate limited'}, {'Retry-After': str(self.retry_after)})
+                self.tokens -= 1
+            if self.random.random() < self.error_rate:
+                self.failed += 1
+                return MockResponse(502, {'message': 'Bad gateway'})
+            self.served += 1
+            self.served_at.append(now)
+
+        page_id = url.split('/')[-2]
+        return MockResponse(200, {'results': [
+            {'type': 'paragraph', 'paragraph': {'rich_text': [{'plain_text': f'Content of {page_id}'}]}}
+        ]})
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(notion_app, 'CHECKPOINT_DIR', str(tmp_path))
+    monkeypatch.setattr(notion_app, '_limiters', notion_app.OrderedDict())
+    return notion_app.app.test_client()
+
+
+def run_extract(client, mock, monkeypatch):
+    monkeypatch.setattr(notion_app.requests, 'request', mock.request)
+    response = client.post('/extract', json={'token': 'secret_test', 'database_id': 'db'})
+    return response.status_code, response.get_json()
+
+
+def test_unthrottled_grows_limit(client, monkeypatch):
+    mock = MockNotion(pages=150)
+    status, body = run_extract(client, mock, monkeypatch)
+
+    assert status == 200
+    assert [item['page_id'] for item in body['data']] == [page['id'] for page in mock.pages]
+    assert body['concurrency']['throttled'] == 0
+    assert body['concurrency']['limit'] > notion_app.INITIAL_CONCURRENCY
+
+
+def test_rate_capped_backs_off_and_completes(client, monkeypatch):
+    mock = MockNotion(pages=150, rate=30, retry_after=0.2)
+    status, body = run_extract(client, mock, monkeypatch)
+
+    assert status == 200
+    assert len(body['data']) == 150
+    assert mock.throttled > 0
+    assert body['concurrency']['throttled'] == mock.throttled
+    assert body['concurrency']['limit'] < notion_app.MAX_CONCURRENCY
+
+
+def test_rate_capped_respects_retry_after(client, monkeypatch):
+    mock = MockNotion(pages=100, rate=20, retry_after=0.3)
+    status, body = run_extract(client, mock, monkeypatch)
+
+    assert status == 200
+    assert mock.throttled > 0
+
+    # Requests already in flight may land just after a 429, but nothing new
+    # should be started until its Retry-After has passed
+    for throttled_at in mock.throttled_at:
+        early = [t for t in mock.served_at if throttled_at + 0.1 < t < throttled_at + 0.3]
+        assert not early
+
+
+def test_intermittent_server_errors_are_retried(client, monkeypatch):
+    mock = MockNotion(pages=150, error_rate=0.1)
+    status, body = run_extract(client, mock, monkeypatch)
+
+    assert status == 200
+    assert len(body['data']) == 150
+    assert all(item['content'] for item in body['data'])
+    assert mock.failed > 0
+    assert body['concurrency']['errors'] == mock.failed
+
+
+def test_limit_halves_on_429_and_recovers():
+    limiter = notion_app.AdaptiveLimiter(initial=8)
+
+    limiter.acquire()
+    limiter.release(0.05, 429, retry_after=0.01)
+    assert int(limiter.limit) == 4
+
+    time.sleep(0.02)
+    for _ in range(50):
+        for _ in range(int(limiter.limit)):
+            limiter.acquire()
+        for _ in range(int(limiter.in_flight)):
+            limiter.release(0.05, 200)
+    assert int(limiter.limit) > 8
+
+
+def test_acquire_waits_for_retry_after():
+    limiter = notion_app.AdaptiveLimiter(initial=4)
+
+    limiter.acquire()
+    limiter.release(0.05, 429, retry_after=0.3)
+
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.25
+    assert limiter.paused_until <= time.monotonic()
+
+
+def test_latency_spike_lowers_limit():
+    limiter = notion_app.AdaptiveLimiter(initial=8)
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(0.3, 200)
+    before = limiter.limit
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(3.0, 200)
+        limiter.last_decrease = 0.0  # let every slow response count
+    assert limiter.limit < before
+
+
+def test_limiters_are_bounded(monkeypatch):
+    monkeypatch.setattr(notion_app, '_limiters', notion_app.OrderedDict())
+    monkeypatch.setattr(notion_app, 'MAX_LIMITERS', 3)
+
+    first = notion_app.get_limiter('token-0')
+    for i in range(1, 5):
+        notion_app.get_limiter(f'token-{i}')
+
+    assert len(notion_app._limiters) == 3
+    assert notion_app.get_limiter('token-0') is not first
+
+
+def test_stats_require_cron_secret(client, monkeypatch):
+    monkeypatch.delenv('CRON_SECRET', raising=False)
+    assert client.get('/stats/concurrency').status_code == 403
+
+    monkeypatch.setenv('CRON_SECRET', 'cron')
+    assert client.get('/stats/concurrency').status_code == 401
+
+    notion_app.get_limiter('secret_test')
+    response = client.get('/stats/concurrency', headers={'Authorization': 'Bearer cron'})
+    assert response.status_code == 200
+    assert notion_app.token_key('secret_test') in response.get_json()
@@ -0,0 +1,213 @@
+"""Scheduled snapshot exports: page-level diffing and the /schedules endpoints"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app as notion_app
+from conftest import MockResponse
+
+
+def notion_time(moment):
+    # Notion reports last_edited_time rounded down to the minute
+    return moment.replace(second=0, microsecond=0).strftime('%Y-%m-%dT%H:%M:00.000Z')
+
+
+class MockDatabase:
+    def __init__(self, pages=5):
+        self.pages = {}
+        self.content = {}
+        self.block_fetches = 0
+        for i in range(pages):
+            self.edit(f'page-{i}', title=f'Page {i}', content=f'Content {i}',
+                      when=datetime.now(timezone.utc) - timedelta(days=1))
+
+    def edit(self, page_id, title=None, content=None, when=None):
+        page = self.pages.setdefault(page_id, {'id': page_id, 'properties': {}})
+        if title is not None:
+            page['properties']['Name'] = {'title': [{'plain_text': title}]}
+        if content is not None:
+            self.content[page_id] = content
+        page['last_edited_time'] = notion_time(when or datetime.now(timezone.utc))
+
+    def request(self, method, url, headers=None, json=None, timeout=None):
+        if method == 'POST':
+            return MockResponse(200, {'results': list(self.pages.values()), 'has_more': False})
+
+        self.block_fetches += 1
+        page_id = url.split('/')[-2]
+        return MockResponse(200, {'results': [
+            {'type': 'paragraph', 'paragraph': {'rich_text': [{'plain_text': self.content[page_id]}]}}
+        ]})
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    schedule = {'name': 'daily', 'database_id': 'db', 'token_env': 'TEST_NOTION_TOKEN', 'formats': ['json']}
+    schedules_file = tmp_path / 'schedules.json'
+    schedules_file.write_text(json.dumps([schedule]))
+
+    monkeypatch.setattr(notion_app, 'SCHEDULES_FILE', str(schedules_file))
+    monkeypatch.setattr(notion_app, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(notion_app, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setenv('TEST_NOTION_TOKEN', 'secret_test')
+    monkeypatch.setenv('CRON_SECRET', 'cron')
+
+    database = MockDatabase()
+    monkeypatch.setattr(notion_app.requests, 'request', database.request)
+    return schedule, schedules_file, database
+
+
+def read_export(result):
+    with open(f"{notion_app.EXPORT_DIR}/daily/{result['files'][0]}", encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_first_run_is_full_baseline(env):
+    schedule, _, database = env
+    result = notion_app.run_schedule(schedule)
+
+    assert result['baseline'] is True
+    assert result['added'] == 5
+    assert database.block_fetches == 5
+
+
+def test_only_changes_are_fetched_and_exported(env):
+    schedule, _, database = env
+    notion_app.run_schedule(schedule)
+    database.block_fetches = 0
+
+    database.edit('page-1', content='New content', when=datetime.now(timezone.utc) + timedelta(minutes=5))
+    database.edit('page-2', title='Renamed', when=datetime.now(timezone.utc) + timedelta(minutes=5))
+    database.edit('page-9', title='Page 9', content='Content 9')
+    del database.pages['page-3']
+
+    result = notion_app.run_schedule(schedule)
+    delta = {item['page_id']: item for item in read_export(result)}
+
+    assert (result['added'], result['modified'], result['removed']) == (1, 2, 1)
+    assert database.block_fetches == 3
+    assert delta['page-1']['changed'] == ['content']
+    assert delta['page-2']['changed'] == ['properties']
+    assert delta['page-3']['change'] == 'removed'
+    assert delta['page-9']['change'] == 'added'
+
+
+def test_edit_in_same_minute_as_last_run_is_caught(env):
+    schedule, _, database = env
+    database.edit('page-0', when=datetime.now(timezone.utc))
+    notion_app.run_schedule(schedule)
+
+    # Edited after the previous query but within the same minute, so the
+    # rounded last_edited_time is unchanged
+    database.content['page-0'] = 'Edited moments later'
+    result = notion_app.run_schedule(schedule)
+
+    assert result['modified'] == 1
+    assert read_export(result)[0]['content'] == 'Edited moments later'
+
+
+def test_unchanged_recent_pages_are_not_exported(env):
+    schedule, _, database = env
+    database.edit('page-0', when=datetime.now(timezone.utc))
+    notion_app.run_schedule(schedule)
+
+    result = notion_app.run_schedule(schedule)
+
+    assert result['fetched'] == 1
+    assert (result['added'], result['modified'], result['removed']) == (0, 0, 0)
+    assert result['files'] == []
+
+
+def test_config_change_starts_new_baseline(env):
+    schedule, _, _ = env
+    notion_app.run_schedule(schedule)
+
+    schedule['database_id'] = 'other-db'
+    result = notion_app.run_schedule(schedule)
+
+    assert result['baseline'] is True
+    assert (result['added'], result['removed']) == (5, 0)
+
+
+def test_endpoints_disabled_without_cron_secret(env, monkeypatch):
+    monkeypatch.delenv('CRON_SECRET')
+    client = notion_app.app.test_client()
+
+    assert client.get('/schedules/run?name=daily').status_code == 403
+    assert client.get('/schedules').status_code == 403
+
+
+def test_endpoints_require_cron_secret(env):
+    client = notion_app.app.test_client()
+
+    assert client.get('/schedules/run').status_code == 401
+    assert client.get('/schedules/run', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+
+def test_run_list_and_download_exports(env):
+    client = notion_app.app.test_client()
+    auth = {'Authorization': 'Bearer cron'}
+
+    results = client.post('/schedules/run', headers=auth).get_json()['results']
+    assert results[0]['added'] == 5
+
+    exports = client.get('/schedules/daily/exports', headers=auth).get_json()['exports']
+    assert [export['filename'] for export in exports] == results[0]['files']
+
+    response = client.get(f"/schedules/daily/exports/{exports[0]['filename']}", headers=auth)
+    assert response.status_code == 200
+    assert len(json.loads(response.data)) == 5
+
+    assert client.get('/schedules/daily/exports/missing.json', headers=auth).status_code == 404
+    assert client.get('/schedules/daily/exports/..%2Fsecret.json', headers=auth).status_code in (400, 404)
+
+
+VALID = {'name': 'daily', 'database_id': 'db', 'token_env': 'TEST_NOTION_TOKEN'}
+
+
+@pytest.mark.parametrize('contents', [
+    '{not json',
+    '{"name": "daily"}',
+    '["daily"]',
+    '[{"name": "../x"}]',
+    json.dumps([{'name': 'daily', 'database_id': 'db', 'token': 'secret_plaintext'}]),
+    json.dumps([dict(VALID, formats='json')]),
+    json.dumps([dict(VALID, formats=['json', 'pdf'])]),
+    json.dumps([dict(VALID, interval_minutes='daily')]),
+    json.dumps([dict(VALID, interval_minutes=0)]),
+])
+def test_malformed_schedules_file_returns_json_error(env, contents):
+    _, schedules_file, _ = env
+    schedules_file.write_text(contents)
+    client = notion_app.app.test_client()
+    auth = {'Authorization': 'Bearer cron'}
+
+    for url in ('/schedules', '/schedules/run'):
+        response = client.get(url, headers=auth)
+        assert response.status_code == 500
+        assert 'error' in response.get_json()
+
+
+def test_invalid_schedule_spends_no_api_calls(env):
+    _, schedules_file, database = env
+    schedules_file.write_text(json.dumps([dict(VALID, formats=['pdf'])]))
+
+    with pytest.raises(ValueError):
+        notion_app.run_due_schedules()
+    assert database.block_fetches == 0
+
+
+def test_removed_pages_export_without_missing_fields(env):
+    schedule, _, database = env
+    schedule['formats'] = ['txt']
+    notion_app.run_schedule(schedule)
+
+    del database.pages['page-3']
+    result = notion_app.run_schedule(schedule)
+
+    with open(f"{notion_app.EXPORT_DIR}/daily/{result['files'][0]}", encoding='utf-8') as f:
+        text = f.read()
+    assert 'CHANGE: removed' in text
+    assert 'DATE:' not in text
+    assert 'BY:' not in text